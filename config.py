@@ -3,13 +3,37 @@ PerfectSSH - Configuration Manager
 Handles loading, saving, and managing application configuration.
 """
 
+import copy
 import json
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; stdlib json is a drop-in fallback
+    orjson = None
+
+def _dumps(data: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    # Same layout as orjson (2-space indent, raw UTF-8), so the file is identical either way
+    return json.dumps(data, indent=2, ensure_ascii=False).encode()
+
+def _loads(raw: bytes) -> Dict[str, Any]:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# Parsed configs keyed by path, tagged with the file mtime they were read at.
+_CONFIG_CACHE: Dict[Path, Tuple[float, Dict[str, Any]]] = {}
+
+_REQUIRED_TOP = frozenset({'mode', 'hop1', 'hop2', 'local_port'})
+_REQUIRED_HOP = frozenset({'ip', 'port', 'user', 'pass'})
 
 class ConfigManager:
     def __init__(self, config_file: Optional[Path] = None):
         self.config_file = config_file or Path(__file__).parent / "config.json"
+        self._last_serialized: bytes = b""
         self.config = self._load_config()
 
     def _default_config(self) -> Dict[str, Any]:
@@ -23,18 +47,28 @@ class ConfigManager:
 
     def _load_config(self) -> Dict[str, Any]:
         if not self.config_file.exists():
-            self._save_config(self._default_config())
-            return self._default_config()
+            data = self._default_config()
+            self._save_config(data)
+            return data
         try:
-            with open(self.config_file, 'r') as f:
-                return json.load(f)
+            mtime = self.config_file.stat().st_mtime
+            cached = _CONFIG_CACHE.get(self.config_file)
+            if cached and cached[0] == mtime:
+                data = copy.deepcopy(cached[1])
+            else:
+                data = _loads(self.config_file.read_bytes())
+                _CONFIG_CACHE[self.config_file] = (mtime, copy.deepcopy(data))
+            self._last_serialized = _dumps(data)
+            return data
         except (json.JSONDecodeError, IOError):
             return self._default_config()
 
     def _save_config(self, data: Dict[str, Any]) -> None:
-        with open(self.config_file, 'w') as f:
-            json.dump(data, f, indent=4)
-        self.config = data
+        serialized = _dumps(data)
+        if serialized != self._last_serialized or not self.config_file.exists():
+            self.config_file.write_bytes(serialized)
+            self._last_serialized = serialized
+            _CONFIG_CACHE[self.config_file] = (self.config_file.stat().st_mtime, copy.deepcopy(data))
 
     def save(self) -> None:
         self._save_config(self.config)
@@ -45,10 +79,8 @@ class ConfigManager:
 
     def validate_config(self) -> bool:
         """Validates the current configuration."""
-        required_fields = ['mode', 'hop1', 'hop2', 'local_port']
-        for field in required_fields:
-            if field not in self.config:
-                return False
+        if not _REQUIRED_TOP <= self.config.keys():
+            return False
         
         if self.config['mode'] not in ['1_hop', '2_hop']:
             return False
@@ -68,21 +100,20 @@ class ConfigManager:
 
     def _validate_hop_config(self, hop: Dict[str, Any]) -> bool:
         """Validates a single hop configuration."""
-        required_hop_fields = ['ip', 'port', 'user', 'pass']
-        for field in required_hop_fields:
-            if field not in hop:
-                return False
+        if not _REQUIRED_HOP <= hop.keys():
+            return False
         
         # Basic IP validation (simple check)
         if not hop['ip'] or not isinstance(hop['ip'], str):
             return False
         
-        # Port validation
-        try:
-            port = int(hop['port'])
-            if not (1 <= port <= 65535):
+        # Port validation; the coerced int is stored back so later checks skip int()
+        port = hop['port']
+        if not isinstance(port, int):
+            try:
+                port = int(port)
+            except (ValueError, TypeError):
                 return False
-        except (ValueError, TypeError):
-            return False
+            hop['port'] = port
         
-        return True
\ No newline at end of file
+        return 1 <= port <= 65535
\ No newline at end of file
@@ -3,364 +3,493 @@ PerfectSSH - Auto Doctor
 Diagnoses and repairs server-side SSH issues.
 """
 
-import subprocess
+import hashlib
+import select
 import logging
+import threading
 import time
-import paramiko
+from types import MappingProxyType
 from utils import SystemUtils
 
+try:
+    import ahocorasick
+except ImportError:  # Optional; falls back to sequential substring checks
+    ahocorasick = None
+
 logger = logging.getLogger(__name__)
 
+# paramiko (and the crypto stack under it) is only needed once a repair runs
+_paramiko = None
+
+def _get_paramiko():
+    global _paramiko
+    if _paramiko is None:
+        import paramiko as _paramiko
+    return _paramiko
+
+# Known error signatures in priority order: when several keywords match,
+# the entry listed first wins (mirrors the original if/elif cascade).
+_SIGNATURES = (
+    # Authentication Issues
+    (("permission denied", "authentication failed"), {
+        "reason": "Authentication Failed",
+        "fixable": True,
+        "severity": "high",
+        "category": "auth",
+        "solutions": ["Check password", "Verify username", "Check SSH key permissions", "Enable password authentication"]
+    }),
+    (("too many authentication failures",), {
+        "reason": "Too Many Authentication Failures",
+        "fixable": True,
+        "severity": "medium",
+        "category": "auth",
+        "solutions": ["Reduce MaxAuthTries in sshd_config", "Use SSH keys instead of passwords"]
+    }),
+
+    # Connection Issues
+    (("connection refused",), {
+        "reason": "SSH Service Not Running or Port Closed",
+        "fixable": True,
+        "severity": "high",
+        "category": "service",
+        "solutions": ["Start SSH service", "Open firewall port", "Check SSH port configuration"]
+    }),
+    (("connection timed out", "timed out"), {
+        "reason": "Connection Timeout - Network or Firewall Issue",
+        "fixable": True,
+        "severity": "medium",
+        "category": "network",
+        "solutions": ["Check network connectivity", "Verify IP address", "Check firewall rules", "Test with different port"]
+    }),
+    (("no route to host", "network is unreachable"), {
+        "reason": "Network Routing Issue",
+        "fixable": False,
+        "severity": "high",
+        "category": "network",
+        "solutions": ["Check network configuration", "Verify IP reachability", "Contact network administrator"]
+    }),
+
+    # SSH Configuration Issues
+    (("channel setup failed", "tcp forwarding"), {
+        "reason": "TCP Forwarding Disabled",
+        "fixable": True,
+        "severity": "high",
+        "category": "config",
+        "solutions": ["Enable AllowTcpForwarding", "Enable GatewayPorts", "Restart SSH service"]
+    }),
+    (("broken pipe", "connection reset by peer"), {
+        "reason": "Connection Interrupted",
+        "fixable": True,
+        "severity": "medium",
+        "category": "config",
+        "solutions": ["Increase ClientAliveInterval", "Check network stability", "Enable KeepAlive"]
+    }),
+
+    # Host Key Issues
+    (("host key verification failed",), {
+        "reason": "Host Key Changed or Verification Failed",
+        "fixable": True,
+        "severity": "medium",
+        "category": "security",
+        "solutions": ["Remove old host key from known_hosts", "Verify server identity", "Use StrictHostKeyChecking=no for testing"]
+    }),
+
+    # Resource Issues
+    (("resource temporarily unavailable",), {
+        "reason": "Server Resource Limits",
+        "fixable": True,
+        "severity": "medium",
+        "category": "system",
+        "solutions": ["Check system resources", "Increase limits in limits.conf", "Optimize server performance"]
+    }),
+)
+
+_UNKNOWN_DIAGNOSIS = MappingProxyType({
+    "reason": "Unknown Error",
+    "fixable": False,
+    "severity": "unknown",
+    "category": "general",
+    "solutions": ()
+})
+
+# Flattened (needle, diagnosis) pairs; the index doubles as the priority.
+# Diagnoses are read-only so the shared records can't be mutated by callers.
+_DIAGNOSIS_TABLE = tuple(
+    (keyword.encode(), MappingProxyType(dict(diagnosis, solutions=tuple(diagnosis["solutions"]))))
+    for keywords, diagnosis in _SIGNATURES
+    for keyword in keywords
+)
+
+def _build_automaton():
+    """Compiles every keyword into one automaton; payload is the table index."""
+    automaton = ahocorasick.Automaton()
+    for priority, (needle, _) in enumerate(_DIAGNOSIS_TABLE):
+        automaton.add_word(needle.decode(), priority)
+    automaton.make_automaton()
+    return automaton
+
+_AUTOMATON = _build_automaton() if ahocorasick is not None else None
+
+# --- REMOTE REPAIR PHASES ---
+# Each phase echoes a sentinel token on completion so a single batched run
+# can be split back into per-phase results.
+
+_NETWORK_SCRIPT = r"""
+log() { echo ">>> Network: $1"; }
+
+log "Checking network interfaces..."
+ip addr show | grep -E "inet |inet6 " | head -5
+
+log "Testing DNS resolution..."
+nslookup google.com 2>/dev/null || echo "DNS resolution failed"
+
+log "Checking network routes..."
+ip route show | head -3
+
+log "Fixing DNS settings..."
+if [ -f /etc/resolv.conf ]; then
+    # Backup
+    cp /etc/resolv.conf /etc/resolv.conf.backup 2>/dev/null
+    # unlocking just in case we locked it before
+    chattr -i /etc/resolv.conf 2>/dev/null || true
+
+    # Simple overwrite
+    echo "nameserver 8.8.8.8" > /etc/resolv.conf
+    echo "nameserver 1.1.1.1" >> /etc/resolv.conf
+fi
+
+log "Network repair complete"
+echo "NETWORK_REPAIR_COMPLETE"
+"""
+
+_SSH_SCRIPT = r"""
+log() { echo ">>> SSH: $1"; }
+
+log "Checking SSH service status..."
+if command -v systemctl >/dev/null; then
+    systemctl is-active sshd >/dev/null 2>&1 || systemctl start sshd
+    systemctl enable sshd >/dev/null 2>&1
+elif command -v service >/dev/null; then
+    service ssh status >/dev/null 2>&1 || service ssh start
+fi
+
+log "Optimizing SSH configuration..."
+CFG="/etc/ssh/sshd_config"
+
+# Backup config
+cp "$CFG" "${CFG}.backup.$(date +%s)" 2>/dev/null
+
+# Essential settings for tunneling, plus higher concurrency limits for heavy
+# browsing (images/video). One awk pass rewrites every key: existing or
+# commented-out entries are replaced in place, missing ones are prepended so
+# they land in the global section ahead of any Match block.
+awk '
+BEGIN {
+    n = split("AllowTcpForwarding GatewayPorts PermitTunnel ClientAliveInterval ClientAliveCountMax TCPKeepAlive MaxAuthTries PasswordAuthentication PermitRootLogin MaxSessions MaxStartups", order, " ")
+    v["AllowTcpForwarding"] = "yes"
+    v["GatewayPorts"] = "yes"
+    v["PermitTunnel"] = "yes"
+    v["ClientAliveInterval"] = "60"
+    v["ClientAliveCountMax"] = "3"
+    v["TCPKeepAlive"] = "yes"
+    v["MaxAuthTries"] = "6"
+    v["PasswordAuthentication"] = "yes"
+    v["PermitRootLogin"] = "yes"
+    v["MaxSessions"] = "1000"
+    v["MaxStartups"] = "100:30:1000"
+}
+{
+    key = $0
+    sub(/^#/, "", key)
+    k = match(key, /^[A-Za-z]+/) ? substr(key, 1, RLENGTH) : ""
+    if (k in v) {
+        lines[NR] = k " " v[k]
+        seen[k] = 1
+    } else {
+        lines[NR] = $0
+    }
+}
+END {
+    for (i = 1; i <= n; i++)
+        if (!(order[i] in seen)) print order[i] " " v[order[i]]
+    for (i = 1; i <= NR; i++) print lines[i]
+}
+' "$CFG" > "${CFG}.tmp" && cat "${CFG}.tmp" > "$CFG"
+rm -f "${CFG}.tmp"
+
+# Get SSH port
+PORT=$(grep "^Port" $CFG | awk '{print $2}')
+[ -z "$PORT" ] && PORT=22
+
+log "Opening firewall for SSH port $PORT..."
+if command -v ufw >/dev/null; then
+    ufw --force enable >/dev/null 2>&1
+    ufw allow $PORT/tcp >/dev/null 2>&1
+    ufw allow 1080/tcp >/dev/null 2>&1
+    ufw reload >/dev/null 2>&1
+fi
+
+if command -v iptables >/dev/null; then
+    iptables -I INPUT -p tcp --dport $PORT -j ACCEPT 2>/dev/null
+    iptables -I INPUT -p tcp --dport 1080 -j ACCEPT 2>/dev/null
+    if command -v iptables-save >/dev/null; then
+        iptables-save > /etc/iptables/rules.v4 2>/dev/null || true
+    fi
+fi
+
+if command -v firewall-cmd >/dev/null; then
+    firewall-cmd --permanent --add-port=$PORT/tcp >/dev/null 2>&1
+    firewall-cmd --permanent --add-port=1080/tcp >/dev/null 2>&1
+    firewall-cmd --reload >/dev/null 2>&1
+fi
+
+log "Restarting SSH service..."
+if command -v systemctl >/dev/null; then
+    systemctl restart sshd
+elif command -v service >/dev/null; then
+    service ssh restart
+fi
+
+log "Waiting for SSH service to stabilize..."
+sleep 3
+
+log "SSH repair complete"
+echo "SSH_REPAIR_COMPLETE"
+"""
+
+_SECURITY_SCRIPT = r"""
+log() { echo ">>> Security: $1"; }
+
+log "Checking system users..."
+# Ensure root has proper shell
+usermod -s /bin/bash root 2>/dev/null || true
+
+log "Setting proper permissions..."
+chmod 600 /etc/ssh/sshd_config 2>/dev/null || true
+chmod 700 /root/.ssh 2>/dev/null || true
+chmod 600 /root/.ssh/* 2>/dev/null || true
+
+log "Security fixes complete"
+echo "SECURITY_FIX_COMPLETE"
+"""
+
+_PERFORMANCE_SCRIPT = r"""
+log() { echo ">>> Performance: $1"; }
+
+# Each block only appends its keys; sysctl.conf is reloaded once at the end.
+log "Enabling BBR congestion control..."
+if ! grep -q "bbr" /etc/sysctl.conf 2>/dev/null; then
+    cat >> /etc/sysctl.conf <<'EOF'
+net.core.default_qdisc=fq
+net.ipv4.tcp_congestion_control=bbr
+EOF
+fi
+
+log "Optimizing network buffers..."
+if ! grep -q "net.core.rmem_max" /etc/sysctl.conf 2>/dev/null; then
+    cat >> /etc/sysctl.conf <<'EOF'
+net.core.rmem_max=16777216
+net.core.wmem_max=16777216
+net.ipv4.tcp_rmem=4096 87380 16777216
+net.ipv4.tcp_wmem=4096 87380 16777216
+EOF
+fi
+
+log "Checking system updates..."
+if command -v apt-get >/dev/null; then
+    apt-get update >/dev/null 2>&1 && apt-get -y upgrade >/dev/null 2>&1
+elif command -v yum >/dev/null; then
+    yum -y update >/dev/null 2>&1
+fi
+
+log "Increasing system limits..."
+if ! grep -q "fs.file-max" /etc/sysctl.conf 2>/dev/null; then
+    cat >> /etc/sysctl.conf <<'EOF'
+fs.file-max = 65535
+net.core.somaxconn = 4096
+net.ipv4.ip_local_port_range = 1024 65535
+EOF
+fi
+
+log "Applying kernel settings..."
+sysctl -p >/dev/null 2>&1
+
+ulimit -n 65535 2>/dev/null || true
+
+log "Performance optimization complete"
+echo "PERFORMANCE_OPT_COMPLETE"
+"""
+
+_VERIFY_SCRIPT = r"""
+log() { echo ">>> Verification: $1"; }
+
+log "Checking SSH service..."
+if command -v systemctl >/dev/null; then
+    systemctl is-active sshd >/dev/null 2>&1 && echo "SSH_ACTIVE"
+elif command -v service >/dev/null; then
+    service ssh status >/dev/null 2>&1 && echo "SSH_ACTIVE"
+fi
+
+log "Checking SSH configuration..."
+grep -q "AllowTcpForwarding yes" /etc/ssh/sshd_config && echo "TCP_FORWARDING_ENABLED"
+
+log "Checking firewall..."
+PORT=$(grep "^Port" /etc/ssh/sshd_config | awk '{print $2}')
+[ -z "$PORT" ] && PORT=22
+
+if command -v ufw >/dev/null; then
+    ufw status | grep -q "$PORT/tcp" && echo "FIREWALL_OPEN"
+elif command -v iptables >/dev/null; then
+    iptables -L | grep -q "dpt:$PORT" && echo "FIREWALL_OPEN"
+fi
+
+log "Verification complete"
+"""
+
+_STAMP_DIR = "/var/lib/perfectssh"
+
+def _run_once(script, name):
+    """Skips a phase on servers that already ran this exact script (stamp keyed by hash)."""
+    digest = hashlib.sha256(script.encode()).hexdigest()[:16]
+    # Under /var/lib rather than the world-writable /tmp, so only root can
+    # create the stamp; without root the touch fails and the phase just reruns
+    stamp = f"{_STAMP_DIR}/{name}-{digest}.done"
+    return (
+        f"if [ -f {stamp} ]; then\n"
+        f"    echo \">>> {name}: already applied, skipping\"\n"
+        f"    echo \"{name.upper()}_COMPLETE\"\n"
+        f"else\n{script}mkdir -p -m 700 {_STAMP_DIR} 2>/dev/null && touch {stamp} 2>/dev/null\nfi\n"
+    )
+
+def _concurrent(*scripts):
+    """Runs independent phases as background subshells and waits for all of them."""
+    return "\n".join(f"(\n{script}) &" for script in scripts) + "\nwait\n"
+
+def _when_dns_broken(script):
+    """Runs a phase only if the server itself cannot resolve names."""
+    # getent goes through libc, so unlike nslookup it is present on every server
+    return (
+        "if getent hosts google.com >/dev/null 2>&1; then\n"
+        "    echo \">>> Network: DNS resolution works, skipping\"\n"
+        f"else\n{script}fi\n"
+    )
+
+def _build_repair_script():
+    """Concatenates the repair phases into one script for a single remote run."""
+    # Security fixes and performance tuning touch unrelated files, so the quick
+    # permission fixes overlap with the I/O-heavy package upgrade.
+    # The performance phase (package upgrade, sysctl appends) is slow and not
+    # idempotent, so it is skipped on servers that already ran this version.
+    # The other phases are the actual fixes and always run.
+    # The network phase rewrites resolv.conf, so whether it is needed is decided
+    # on the server: reaching it over SSH says nothing about its own DNS.
+    phases = [
+        _when_dns_broken(_NETWORK_SCRIPT),
+        _SSH_SCRIPT,
+        _concurrent(_SECURITY_SCRIPT, _run_once(_PERFORMANCE_SCRIPT, "performance_opt")),
+        _VERIFY_SCRIPT,
+    ]
+    return "\n".join(phases)
+
+# Assembled and encoded once at import
+_REPAIR_SCRIPT = _build_repair_script().encode()
+
+# Idle repair sessions stay open this long for reuse, like OpenSSH ControlPersist
+_SESSION_PERSIST = 60
+
 class AutoDoctor:
+    # Host keys accepted during this process, shared by every repair session
+    _host_keys = None
+    # Parked repair sessions: (ip, port, user) -> (client, expiry timer)
+    _sessions = {}
+    # Guards _sessions: parking, claiming and expiry timers race otherwise
+    _sessions_lock = threading.Lock()
+
     def analyze_error(self, error_msg):
         """Advanced error analysis with comprehensive diagnosis."""
         error = error_msg.lower()
-        diagnosis = {
-            "reason": "Unknown Error",
-            "fixable": False,
-            "severity": "unknown",
-            "category": "general",
-            "solutions": []
-        }
-
-        # Authentication Issues
-        if "permission denied" in error or "authentication failed" in error:
-            diagnosis.update({
-                "reason": "Authentication Failed",
-                "fixable": True,
-                "severity": "high",
-                "category": "auth",
-                "solutions": ["Check password", "Verify username", "Check SSH key permissions", "Enable password authentication"]
-            })
-        elif "too many authentication failures" in error:
-            diagnosis.update({
-                "reason": "Too Many Authentication Failures",
-                "fixable": True,
-                "severity": "medium",
-                "category": "auth",
-                "solutions": ["Reduce MaxAuthTries in sshd_config", "Use SSH keys instead of passwords"]
-            })
-
-        # Connection Issues
-        elif "connection refused" in error:
-            diagnosis.update({
-                "reason": "SSH Service Not Running or Port Closed",
-                "fixable": True,
-                "severity": "high",
-                "category": "service",
-                "solutions": ["Start SSH service", "Open firewall port", "Check SSH port configuration"]
-            })
-        elif "connection timed out" in error or "timed out" in error:
-            diagnosis.update({
-                "reason": "Connection Timeout - Network or Firewall Issue",
-                "fixable": True,
-                "severity": "medium",
-                "category": "network",
-                "solutions": ["Check network connectivity", "Verify IP address", "Check firewall rules", "Test with different port"]
-            })
-        elif "no route to host" in error or "network is unreachable" in error:
-            diagnosis.update({
-                "reason": "Network Routing Issue",
-                "fixable": False,
-                "severity": "high",
-                "category": "network",
-                "solutions": ["Check network configuration", "Verify IP reachability", "Contact network administrator"]
-            })
-
-        # SSH Configuration Issues
-        elif "channel setup failed" in error or "tcp forwarding" in error:
-            diagnosis.update({
-                "reason": "TCP Forwarding Disabled",
-                "fixable": True,
-                "severity": "high",
-                "category": "config",
-                "solutions": ["Enable AllowTcpForwarding", "Enable GatewayPorts", "Restart SSH service"]
-            })
-        elif "broken pipe" in error or "connection reset by peer" in error:
-            diagnosis.update({
-                "reason": "Connection Interrupted",
-                "fixable": True,
-                "severity": "medium",
-                "category": "config",
-                "solutions": ["Increase ClientAliveInterval", "Check network stability", "Enable KeepAlive"]
-            })
-
-        # Host Key Issues
-        elif "host key verification failed" in error:
-            diagnosis.update({
-                "reason": "Host Key Changed or Verification Failed",
-                "fixable": True,
-                "severity": "medium",
-                "category": "security",
-                "solutions": ["Remove old host key from known_hosts", "Verify server identity", "Use StrictHostKeyChecking=no for testing"]
-            })
-
-        # Resource Issues
-        elif "resource temporarily unavailable" in error:
-            diagnosis.update({
-                "reason": "Server Resource Limits",
-                "fixable": True,
-                "severity": "medium",
-                "category": "system",
-                "solutions": ["Check system resources", "Increase limits in limits.conf", "Optimize server performance"]
-            })
-
-        logger.info(f"Diagnosed error: {diagnosis['reason']} (severity: {diagnosis['severity']}, fixable: {diagnosis['fixable']})")
+        source = _UNKNOWN_DIAGNOSIS
+
+        if _AUTOMATON is not None:
+            # Single pass over the message; keep the highest-priority hit
+            match = None
+            for _, priority in _AUTOMATON.iter(error):
+                if match is None or priority < match:
+                    match = priority
+                    if match == 0:
+                        break
+            if match is not None:
+                source = _DIAGNOSIS_TABLE[match][1]
+        else:
+            errb = error.encode()
+            for needle, candidate in _DIAGNOSIS_TABLE:
+                if needle in errb:
+                    source = candidate
+                    break
+
+        diagnosis = dict(source, solutions=list(source["solutions"]))
+
+        logger.info("Diagnosed error: %s (severity: %s, fixable: %s)", diagnosis['reason'], diagnosis['severity'], diagnosis['fixable'])
         return diagnosis
 
     def repair_server(self, hop_config):
         """Comprehensive server repair with multiple phases."""
-        logger.info(f"Starting comprehensive repair for server {hop_config['ip']}:{hop_config['port']}")
+        logger.info("Starting comprehensive repair for server %s:%s", hop_config['ip'], hop_config['port'])
 
-        # Phase 1: Basic connectivity test
-        if not self._test_connectivity(hop_config):
-            logger.warning("Basic connectivity test failed, attempting network fixes")
-            self._repair_network(hop_config)
+        try:
+            client = self._open_client(hop_config)
+        except Exception as e:
+            logger.error("SSH service repair failed: %s", e)
+            return False, f"SSH Service Repair Failed: {e}"
 
-        # Phase 2: SSH service and configuration
-        success, message = self._repair_ssh_service(hop_config)
-        if not success:
-            logger.error(f"SSH service repair failed: {message}")
-            return False, f"SSH Service Repair Failed: {message}"
+        # All phases run as one batched script over a single channel
+        try:
+            logger.info("Repairing network and SSH service, applying security and performance fixes, verifying")
+            success, output = self._run_remote_script(client, _REPAIR_SCRIPT, "repair_all")
+        finally:
+            self._release_client(hop_config, client)
 
-        # Phase 3: Security and optimization
-        self._repair_security(hop_config)
-        self._repair_performance(hop_config)
+        if not success or "SSH_REPAIR_COMPLETE" not in output:
+            logger.error("SSH service repair failed: %s", output)
+            return False, f"SSH Service Repair Failed: {output}"
+
+        for token, phase in (("SECURITY_FIX_COMPLETE", "security_fix"), ("PERFORMANCE_OPT_COMPLETE", "performance_opt")):
+            if token not in output:
+                logger.warning("%s did not report completion", phase)
 
         # Phase 4: Final verification
-        if self._verify_repair(hop_config):
+        if "SSH_ACTIVE" in output and "TCP_FORWARDING_ENABLED" in output:
             logger.info("Server repair completed successfully")
             return True, "Comprehensive Repair Successful"
         else:
             logger.warning("Repair completed but verification failed")
             return False, "Repair completed but verification failed"
 
-    def _test_connectivity(self, hop_config):
-        """Test basic connectivity to server."""
-        logger.debug("Testing basic connectivity")
-        try:
-            # Simple ping test
-            result = subprocess.run(['ping', '-c', '2', '-W', '3', hop_config['ip']],
-                                  capture_output=True, text=True, timeout=10)
-            return result.returncode == 0
-        except:
-            return False
-
-    def _repair_network(self, hop_config):
-        """Repair network-related issues."""
-        logger.info("Attempting network repairs")
-        network_script = r"""
-        log() { echo ">>> Network: $1"; }
-
-        log "Checking network interfaces..."
-        ip addr show | grep -E "inet |inet6 " | head -5
-
-        log "Testing DNS resolution..."
-        nslookup google.com 2>/dev/null || echo "DNS resolution failed"
-
-        log "Checking network routes..."
-        ip route show | head -3
-
-        log "Fixing DNS settings..."
-        if [ -f /etc/resolv.conf ]; then
-            # Backup
-            cp /etc/resolv.conf /etc/resolv.conf.backup 2>/dev/null
-            # unlocking just in case we locked it before
-            chattr -i /etc/resolv.conf 2>/dev/null || true
-            
-            # Simple overwrite
-            echo "nameserver 8.8.8.8" > /etc/resolv.conf
-            echo "nameserver 1.1.1.1" >> /etc/resolv.conf
-        fi
-
-        log "Network repair complete"
-        """
-        self._run_remote_script(hop_config, network_script, "network_repair")
-
-    def _repair_ssh_service(self, hop_config):
-        """Repair SSH service and configuration."""
-        logger.info("Repairing SSH service and configuration")
-
-        ssh_script = r"""
-        log() { echo ">>> SSH: $1"; }
-
-        log "Checking SSH service status..."
-        if command -v systemctl >/dev/null;
-            systemctl is-active sshd >/dev/null 2>&1 || systemctl start sshd
-            systemctl enable sshd >/dev/null 2>&1
-        elif command -v service >/dev/null;
-            service ssh status >/dev/null 2>&1 || service ssh start
-        fi
-
-        log "Optimizing SSH configuration..."
-        CFG="/etc/ssh/sshd_config"
-
-        # Backup config
-        cp "$CFG" "${CFG}.backup.$(date +%s)" 2>/dev/null
-
-        # Essential settings for tunneling
-        sed -i 's/^#\?AllowTcpForwarding.*/AllowTcpForwarding yes/g' $CFG
-        sed -i 's/^#\?GatewayPorts.*/GatewayPorts yes/g' $CFG
-        sed -i 's/^#\?PermitTunnel.*/PermitTunnel yes/g' $CFG
-        sed -i 's/^#\?ClientAliveInterval.*/ClientAliveInterval 60/g' $CFG
-        sed -i 's/^#\?ClientAliveCountMax.*/ClientAliveCountMax 3/g' $CFG
-        sed -i 's/^#\?TCPKeepAlive.*/TCPKeepAlive yes/g' $CFG
-        sed -i 's/^#\?MaxAuthTries.*/MaxAuthTries 6/g' $CFG
-        sed -i 's/^#\?PasswordAuthentication.*/PasswordAuthentication yes/g' $CFG
-        sed -i 's/^#\?PermitRootLogin.*/PermitRootLogin yes/g' $CFG
-        
-        # Increase concurrency limits for heavy browsing (images/video)
-        sed -i 's/^#\?MaxSessions.*/MaxSessions 1000/g' $CFG
-        sed -i 's/^#\?MaxStartups.*/MaxStartups 100:30:1000/g' $CFG
-
-        # Get SSH port
-        PORT=$(grep "^Port" $CFG | awk '{print $2}')
-        [ -z "$PORT" ] && PORT=22
-
-        log "Opening firewall for SSH port $PORT..."
-        if command -v ufw >/dev/null;
-            ufw --force enable >/dev/null 2>&1
-            ufw allow $PORT/tcp >/dev/null 2>&1
-            ufw allow 1080/tcp >/dev/null 2>&1
-            ufw reload >/dev/null 2>&1
-        fi
-
-        if command -v iptables >/dev/null;
-            iptables -I INPUT -p tcp --dport $PORT -j ACCEPT 2>/dev/null
-            iptables -I INPUT -p tcp --dport 1080 -j ACCEPT 2>/dev/null
-            if command -v iptables-save >/dev/null;
-                iptables-save > /etc/iptables/rules.v4 2>/dev/null || true
-            fi
-        fi
-
-        if command -v firewall-cmd >/dev/null;
-            firewall-cmd --permanent --add-port=$PORT/tcp >/dev/null 2>&1
-            firewall-cmd --permanent --add-port=1080/tcp >/dev/null 2>&1
-            firewall-cmd --reload >/dev/null 2>&1
-        fi
-
-        log "Restarting SSH service..."
-        if command -v systemctl >/dev/null;
-            systemctl restart sshd
-        elif command -v service >/dev/null;
-            service ssh restart
-        fi
-
-        log "Waiting for SSH service to stabilize..."
-        sleep 3
-
-        log "SSH repair complete"
-        echo "SSH_REPAIR_COMPLETE"
-        """
-
-        return self._run_remote_script(hop_config, ssh_script, "ssh_repair")
-
-    def _repair_security(self, hop_config):
-        """Apply basic security fixes."""
-        logger.info("Applying security fixes")
-
-        security_script = r"""
-        log() { echo ">>> Security: $1"; }
-
-        log "Checking system users..."
-        # Ensure root has proper shell
-        usermod -s /bin/bash root 2>/dev/null || true
-
-        log "Setting proper permissions..."
-        chmod 600 /etc/ssh/sshd_config 2>/dev/null || true
-        chmod 700 /root/.ssh 2>/dev/null || true
-        chmod 600 /root/.ssh/* 2>/dev/null || true
-
-        log "Security fixes complete"
-        """
-
-        self._run_remote_script(hop_config, security_script, "security_fix")
-
-    def _repair_performance(self, hop_config):
-        """Apply performance optimizations."""
-        logger.info("Applying performance optimizations")
-
-        perf_script = r"""
-        log() { echo ">>> Performance: $1"; }
-
-        log "Enabling BBR congestion control..."
-        if ! grep -q "bbr" /etc/sysctl.conf 2>/dev/null;
-            echo "net.core.default_qdisc=fq" >> /etc/sysctl.conf
-            echo "net.ipv4.tcp_congestion_control=bbr" >> /etc/sysctl.conf
-            sysctl -p >/dev/null 2>&1
-        fi
-
-        log "Optimizing network buffers..."
-        if ! grep -q "net.core.rmem_max" /etc/sysctl.conf 2>/dev/null;
-            echo "net.core.rmem_max=16777216" >> /etc/sysctl.conf
-            echo "net.core.wmem_max=16777216" >> /etc/sysctl.conf
-            echo "net.ipv4.tcp_rmem=4096 87380 16777216" >> /etc/sysctl.conf
-            echo "net.ipv4.tcp_wmem=4096 87380 16777216" >> /etc/sysctl.conf
-            sysctl -p >/dev/null 2>&1
-        fi
-
-        log "Checking system updates..."
-        if command -v apt-get >/dev/null; then
-            apt-get update >/dev/null 2>&1 && apt-get -y upgrade >/dev/null 2>&1
-        elif command -v yum >/dev/null; then
-            yum -y update >/dev/null 2>&1
-        fi
-
-        log "Increasing system limits..."
-        echo "fs.file-max = 65535" >> /etc/sysctl.conf
-        echo "net.core.somaxconn = 4096" >> /etc/sysctl.conf
-        echo "net.ipv4.ip_local_port_range = 1024 65535" >> /etc/sysctl.conf
-        sysctl -p >/dev/null 2>&1
-        
-        ulimit -n 65535 2>/dev/null || true
-
-        log "Performance optimization complete"
-        """
-
-        self._run_remote_script(hop_config, perf_script, "performance_opt")
-
-    def _verify_repair(self, hop_config):
-        """Verify that repairs were successful."""
-        logger.info("Verifying repair success")
-
-        verify_script = r"""
-        log() { echo ">>> Verification: $1"; }
-
-        log "Checking SSH service..."
-        if command -v systemctl >/dev/null;
-            systemctl is-active sshd >/dev/null 2>&1 && echo "SSH_ACTIVE"
-        elif command -v service >/dev/null;
-            service ssh status >/dev/null 2>&1 && echo "SSH_ACTIVE"
-        fi
-
-        log "Checking SSH configuration..."
-        grep -q "AllowTcpForwarding yes" /etc/ssh/sshd_config && echo "TCP_FORWARDING_ENABLED"
-
-        log "Checking firewall..."
-        PORT=$(grep "^Port" /etc/ssh/sshd_config | awk '{print $2}')
-        [ -z "$PORT" ] && PORT=22
-
-        if command -v ufw >/dev/null;
-            ufw status | grep -q "$PORT/tcp" && echo "FIREWALL_OPEN"
-        elif command -v iptables >/dev/null;
-            iptables -L | grep -q "dpt:$PORT" && echo "FIREWALL_OPEN"
-        fi
-
-        log "Verification complete"
-        """
-
-        success, output = self._run_remote_script(hop_config, verify_script, "verification")
-        if success and "SSH_ACTIVE" in output and "TCP_FORWARDING_ENABLED" in output:
-            return True
-        return False
-
-    def _run_remote_script(self, hop_config, script, operation_name):
-        """Execute a script on the remote server using paramiko."""
-        logger.debug(f"Running {operation_name} script on {hop_config['ip']}")
-
+    @staticmethod
+    def _session_key(hop_config):
+        return (hop_config['ip'], int(hop_config['port']), hop_config['user'])
+
+    def _open_client(self, hop_config):
+        """Opens the SSH session used by all repair phases, reusing a parked one if alive."""
+        with AutoDoctor._sessions_lock:
+            parked = AutoDoctor._sessions.pop(self._session_key(hop_config), None)
+        if parked:
+            client, timer = parked
+            timer.cancel()
+            transport = client.get_transport()
+            if transport is not None and transport.is_active():
+                logger.debug("Reusing repair session to %s", hop_config['ip'])
+                return client
+            client.close()
+
+        logger.debug("Opening repair session to %s", hop_config['ip'])
+        paramiko = _get_paramiko()
+        if AutoDoctor._host_keys is None:
+            AutoDoctor._host_keys = paramiko.HostKeys()
         client = paramiko.SSHClient()
+        # AutoAddPolicy records unknown keys in-memory in this shared table
+        client._host_keys = AutoDoctor._host_keys
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
         try:
             client.connect(
                 hostname=hop_config['ip'],
@@ -368,39 +497,82 @@ class AutoDoctor:
                 username=hop_config['user'],
                 password=hop_config['pass'],
                 timeout=15,
-                banner_timeout=30
+                banner_timeout=30,
+                compress=True,  # Repair scripts and their output are plain text
+                allow_agent=False,
+                look_for_keys=False
             )
-
-            logger.debug(f"Executing script via SSH: {operation_name}")
-            # Combine lines and escape appropriately if needed, but paramiko exec_command 
-            # generally handles the command string as is.
-            # The script is a multi-line string, we can execute it by wrapping in bash.
-            # However, simpler is often better. The original code replaced newlines with semicolons.
-            
-            # Using heredoc or passing as argument to bash -s is cleaner for complex scripts
-            # But let's stick to the previous logic of joining with semicolons for simplicity if it works,
-            # or better, just exec_command(script) if it's valid shell syntax.
-            
-            # The original code did: full_script = script.replace("\n", " ; ")
-            # Let's improve this by executing it as a single bash command.
-            
-            stdin, stdout, stderr = client.exec_command(f"bash -c {repr(script)}")
-            
-            # Wait for command to finish
-            exit_status = stdout.channel.recv_exit_status()
-            
-            out_str = stdout.read().decode('utf-8')
-            err_str = stderr.read().decode('utf-8')
+        except Exception:
+            client.close()
+            raise
+        # Keep the shared session alive through long phases (e.g. apt-get upgrade)
+        client.get_transport().set_keepalive(30)
+        return client
+
+    def _release_client(self, hop_config, client):
+        """Parks a repair session for reuse; it is closed if idle past _SESSION_PERSIST."""
+        key = self._session_key(hop_config)
+        timer = threading.Timer(_SESSION_PERSIST, self._expire_client, (key, client))
+        timer.daemon = True
+        with AutoDoctor._sessions_lock:
+            displaced = AutoDoctor._sessions.get(key)
+            AutoDoctor._sessions[key] = (client, timer)
+            timer.start()
+        # A concurrent repair to the same server parked its session first
+        if displaced and displaced[0] is not client:
+            displaced[1].cancel()
+            displaced[0].close()
+
+    @staticmethod
+    def _expire_client(key, client):
+        # Only close if still parked; a concurrent _open_client may have claimed it,
+        # and a newer session parked under the same key is left to its own timer
+        with AutoDoctor._sessions_lock:
+            parked = AutoDoctor._sessions.get(key)
+            if not parked or parked[0] is not client:
+                return
+            del AutoDoctor._sessions[key]
+        client.close()
+
+    def _run_remote_script(self, client, script, operation_name):
+        """Execute a script (pre-encoded bytes) on the remote server over an open paramiko session."""
+        logger.debug("Running %s script", operation_name)
+
+        chan = None
+        try:
+            logger.debug("Executing script via SSH: %s", operation_name)
+            # Stream the script to bash over stdin rather than quoting it into argv
+            chan = client.get_transport().open_session()
+            chan.exec_command("bash -s")
+            chan.sendall(script)
+            chan.shutdown_write()
+
+            # Drain output while the script runs so the channel window never fills
+            out_buf = bytearray()
+            err_buf = bytearray()
+            while True:
+                select.select([chan], [], [], 1)
+                while chan.recv_ready():
+                    out_buf += chan.recv(65536)
+                while chan.recv_stderr_ready():
+                    err_buf += chan.recv_stderr(65536)
+                if chan.exit_status_ready() and not chan.recv_ready() and not chan.recv_stderr_ready():
+                    break
+            exit_status = chan.recv_exit_status()
+
+            out_str = out_buf.decode('utf-8')
+            err_str = err_buf.decode('utf-8')
 
             if exit_status == 0:
-                logger.debug(f"{operation_name} completed successfully")
+                logger.debug("%s completed successfully", operation_name)
                 return True, out_str
             else:
-                logger.warning(f"{operation_name} failed: {err_str}")
+                logger.warning("%s failed: %s", operation_name, err_str)
                 return False, err_str
 
         except Exception as e:
-            logger.error(f"Exception during {operation_name}: {e}")
+            logger.error("Exception during %s: %s", operation_name, e)
             return False, str(e)
         finally:
-            client.close()
\ No newline at end of file
+            if chan is not None:
+                chan.close()
@@ -5,8 +5,27 @@ Centralized logging setup for the application.
 
 import logging
 import sys
+import time
 from pathlib import Path
 
+LOG_FORMAT = '{asctime} - {name} - {levelname} - {message}'
+
+class _FastFormatter(logging.Formatter):
+    """Formatter that renders the strftime part of asctime once per second."""
+
+    def __init__(self, fmt=LOG_FORMAT):
+        super().__init__(fmt, style='{')
+        # (second, stamp) as one tuple so concurrent handlers never see a mismatched pair
+        self._cached = (None, '')
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        cached_second, stamp = self._cached
+        if second != cached_second:
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S', self.converter(record.created))
+            self._cached = (second, stamp)
+        return f"{stamp},{int(record.msecs):03d}"
+
 def setup_logging(log_level=logging.INFO, log_file=None):
     """Setup logging configuration for the application."""
     
@@ -17,18 +36,20 @@ def setup_logging(log_level=logging.INFO, log_file=None):
     if log_file is None:
         log_file = log_dir / "perfectssh.log"
     
-    # Configure logging
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+    # Only echo to the terminal when there is one to look at
+    handlers = [logging.FileHandler(log_file)]
+    if sys.stdout.isatty():
+        handlers.append(logging.StreamHandler(sys.stdout))
+    
+    formatter = _FastFormatter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # Configure logging; force replaces handlers left over from a previous setup
+    logging.basicConfig(level=log_level, handlers=handlers, force=True)
     
     # Reduce noise from libraries
     logging.getLogger('paramiko').setLevel(logging.WARNING)
     logging.getLogger('requests').setLevel(logging.WARNING)
     
-    return logging.getLogger('perfectssh')
\ No newline at end of file
+    return logging.getLogger('perfectssh')
@@ -21,27 +21,29 @@ from datetime import datetime
 from pathlib import Path
 
 # --- AUTO-INSTALL DEPENDENCIES ---
+REQUIRED_LIBS = ['rich', 'requests', 'psutil', 'inquirer', 'paramiko']
+
 def check_dependencies():
-    """Checks and installs required Python packages automatically."""
-    required_libs = ['rich', 'requests', 'psutil', 'inquirer', 'paramiko']
-    missing_libs = []
+    """Installs any missing Python packages, then restarts."""
+    from importlib.util import find_spec
+    # find_spec only consults the import finders; nothing is executed or loaded.
+    # This runs at startup because several of these are imported lazily on first use.
+    missing_libs = [lib for lib in REQUIRED_LIBS if find_spec(lib) is None]
     
-    for lib in required_libs:
-        try:
-            __import__(lib)
-        except ImportError:
-            missing_libs.append(lib)
+    if not missing_libs:
+        return
     
-    if missing_libs:
-        print(f"Installing missing libraries: {', '.join(missing_libs)}...")
-        try:
-            import subprocess
-            subprocess.check_call([sys.executable, "-m", "pip", "install"] + missing_libs)
-            print("Libraries installed. Restarting...")
-            os.execv(sys.executable, ['python3'] + sys.argv)
-        except Exception as e:
-            print(f"Critical Error: Could not install dependencies. {e}")
-            sys.exit(1)
+    print(f"Installing missing libraries: {', '.join(missing_libs)}...")
+    try:
+        import subprocess
+        # Prefer wheels (including pip's cache) over building from source
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "--prefer-binary"] + missing_libs)
+        print("Libraries installed. Restarting...")
+        os.execv(sys.executable, ['python3'] + sys.argv)
+    except Exception as e:
+        print(f"Critical Error: Could not install dependencies. {e}")
+        print(f"Install them manually with: {sys.executable} -m pip install -r requirements.txt")
+        sys.exit(1)
 
 check_dependencies()
 
@@ -61,6 +63,22 @@ from logging_config import setup_logging
 console = Console()
 logger = setup_logging()
 
+# Main menu variants, with and without a configured server
+MENU_CONFIGURED = (
+    ("⚡ Connect", 'conn'),
+    ("⚙️ Settings", 'set'),
+    ("🌍 Check IP", 'ip'),
+    ("🔧 Reset Network", 'tool'),
+    ("❌ Exit", 'exit'),
+)
+MENU_UNCONFIGURED = (
+    ("⚙️ Settings", 'set'),
+    ("❌ Exit", 'exit'),
+)
+
+# Static, so it is built once rather than on every pass through the menu
+BANNER = Panel(Align.center("[bold cyan]PERFECTSSH[/bold cyan] [dim]2.0.0[/dim]"), border_style="cyan")
+
 # --- GRACEFUL EXIT HANDLER ---
 def signal_handler(sig, frame):
     """Handles Ctrl+C to exit cleanly without tracebacks."""
@@ -81,7 +99,7 @@ def main():
 
     while True:
         SystemUtils.clear_screen()
-        console.print(Panel(Align.center("[bold cyan]PERFECTSSH[/bold cyan] [dim]2.0.0[/dim]"), border_style="cyan"))
+        console.print(BANNER)
         
         # --- DASHBOARD STATE ---
         if show_dashboard(manager):
@@ -92,18 +110,7 @@ def main():
         config = manager.config_manager.config
         is_configured = manager.config_manager.is_configured()
         
-        # Dynamic Menu Construction
-        menu_choices = []
-        if is_configured:
-            menu_choices.append(("⚡ Connect", 'conn'))
-        
-        menu_choices.append(("⚙️ Settings", 'set'))
-        
-        if is_configured:
-            menu_choices.append(("🌍 Check IP", 'ip'))
-            menu_choices.append(("🔧 Reset Network", 'tool'))
-            
-        menu_choices.append(("❌ Exit", 'exit'))
+        menu_choices = MENU_CONFIGURED if is_configured else MENU_UNCONFIGURED
         
         # Display current status summary
         if is_configured:
@@ -1,15 +1,89 @@
 import socket
 import threading
-import select
+import queue
+import selectors
 import logging
 import struct
 import socketserver
 
 logger = logging.getLogger(__name__)
 
-class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    daemon_threads = True
+# Forwarding read size; matches a typical TCP receive window
+_CHUNK_SIZE = 65536
+
+# Kernel buffer size for accepted client sockets
+_SOCKET_BUFFER = 4 << 20
+
+# Largest possible greeting (2 + 255 methods) plus request (4 + 1 + 255 + 2)
+_HANDSHAKE_MAX = 2 + 255 + 4 + 1 + 255 + 2
+
+# SOCKS5 replies; BND.ADDR/BND.PORT are always reported as 0.0.0.0:0
+_SOCKS_NO_AUTH = b"\x05\x00"
+_SOCKS_REPLY_SUCCESS = b"\x05\x00\x00\x01" + bytes(6)
+_SOCKS_REPLY_HOST_UNREACHABLE = b"\x05\x04\x00\x01" + bytes(6)
+_SOCKS_REPLY_CMD_UNSUPPORTED = b"\x05\x07\x00\x01" + bytes(6)
+
+class ThreadingTCPServer(socketserver.TCPServer):
+    """TCPServer that hands connections to a bounded pool of reusable daemon workers."""
     allow_reuse_address = True
+    request_queue_size = 128
+    max_workers = 256
+
+    def __init__(self, server_address, RequestHandlerClass):
+        # Set up before binding: TCPServer.__init__ calls server_close() if the bind fails
+        self._requests = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._idle = 0      # Workers waiting for a request that nobody has claimed yet
+        self._backlog = 0   # Requests queued while every worker was busy
+        super().__init__(server_address, RequestHandlerClass)
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            spawn = False
+            if self._idle:
+                self._idle -= 1
+            elif self._workers < self.max_workers:
+                self._workers += 1
+                spawn = True
+            else:
+                self._backlog += 1
+        self._requests.put((request, client_address))
+        if spawn:
+            threading.Thread(target=self._worker, daemon=True, name="socks-worker").start()
+
+    def finish_request(self, request, client_address):
+        # Handshake replies are tiny, so Nagle only adds latency; large buffers cut wakeups per MB
+        request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        request.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _SOCKET_BUFFER)
+        request.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, _SOCKET_BUFFER)
+        super().finish_request(request, client_address)
+
+    def _worker(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+            with self._lock:
+                if self._backlog:
+                    self._backlog -= 1
+                else:
+                    self._idle += 1
+
+    def server_close(self):
+        super().server_close()
+        # Release every worker still parked on the queue
+        with self._lock:
+            workers, self._workers = self._workers, 0
+        for _ in range(workers):
+            self._requests.put(None)
 
 class SocksProxy:
     def __init__(self, port, ssh_transport):
@@ -17,53 +91,128 @@ class SocksProxy:
         self.ssh_transport = ssh_transport
         self.server = None
         self.server_thread = None
+        # Bytes tunneled since start: rx is remote -> client, tx is client -> remote
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self._counter_lock = threading.Lock()
+        # Client sockets and SSH channels of streams still being forwarded
+        self._open = set()
+        self._open_lock = threading.Lock()
+        self._stopping = False
+
+    def _track(self, conn):
+        """Registers a stream for stop(); False if the proxy is already stopping."""
+        with self._open_lock:
+            if self._stopping:
+                return False
+            self._open.add(conn)
+            return True
+
+    def _untrack(self, *conns):
+        with self._open_lock:
+            self._open.difference_update(conns)
+
+    def _close_open(self):
+        """Tears down every stream in flight so none outlives the proxy."""
+        with self._open_lock:
+            self._stopping = True
+            conns, self._open = self._open, set()
+        for conn in conns:
+            if isinstance(conn, socket.socket):
+                # shutdown wakes the forwarding selector; close alone may not
+                try: conn.shutdown(socket.SHUT_RDWR)
+                except OSError: pass
+            try: conn.close()
+            except Exception: pass
+        if conns:
+            logger.info(f"Closed {len(conns)} open SOCKS connection(s)")
+
+    def _count(self, rx=0, tx=0):
+        with self._counter_lock:
+            self.rx_bytes += rx
+            self.tx_bytes += tx
+
+    def counters(self):
+        """Returns a consistent (rx_bytes, tx_bytes) snapshot."""
+        with self._counter_lock:
+            return self.rx_bytes, self.tx_bytes
 
     def start(self):
+        count = self._count
+        track, untrack = self._track, self._untrack
+
         class SocksHandler(socketserver.BaseRequestHandler):
             transport = self.ssh_transport
 
             def handle(self):
+                remote_channel = None
+                if not track(self.request):
+                    return
                 try:
+                    # The whole handshake is read into one buffer and parsed in
+                    # place; recv_into only runs again when a read comes up short.
+                    buf = bytearray(_HANDSHAKE_MAX)
+                    view = memoryview(buf)
+
                     # SOCKS5 Initial Handshake
                     # Client sends: VER(1) | NMETHODS(1) | METHODS(N)
-                    header = self.request.recv(2)
-                    if not header or header[0] != 5:
+                    have = self._fill(view, 0, 2)
+                    if have < 0 or buf[0] != 5:
                         return
 
-                    nmethods = header[1]
-                    _ = self.request.recv(nmethods) # Consume methods
+                    off = 2 + buf[1] # Skip methods
+                    have = self._fill(view, have, off)
+                    if have < 0:
+                        return
                     
                     # Respond: VER(5) | METHOD(00 - No Auth)
-                    self.request.sendall(b"\x05\x00")
+                    self.request.sendall(_SOCKS_NO_AUTH)
 
                     # Request Details
                     # Client sends: VER(1) | CMD(1) | RSV(1) | ATYP(1) | ADDR | PORT
-                    details = self.request.recv(4)
-                    if not details or len(details) < 4:
+                    have = self._fill(view, have, off + 4)
+                    if have < 0:
                         return
 
-                    ver, cmd, rsv, atyp = details
+                    ver, cmd, rsv, atyp = struct.unpack_from('>BBBB', buf, off)
+                    off += 4
 
                     if cmd != 1: # Only CONNECT supported
-                        self.request.sendall(b"\x05\x07\x00\x01\x00\x00\x00\x00\x00\x00") # Command not supported
+                        self.request.sendall(_SOCKS_REPLY_CMD_UNSUPPORTED)
                         return
 
                     # Parse Destination Address
                     if atyp == 1: # IPv4
-                        addr_bytes = self.request.recv(4)
-                        dest_addr = socket.inet_ntoa(addr_bytes)
+                        addr_len = 4
                     elif atyp == 3: # Domain
-                        addr_len = ord(self.request.recv(1))
-                        dest_addr = self.request.recv(addr_len).decode()
+                        have = self._fill(view, have, off + 1)
+                        if have < 0:
+                            return
+                        addr_len = buf[off]
+                        off += 1
                     elif atyp == 4: # IPv6
-                        addr_bytes = self.request.recv(16)
-                        dest_addr = socket.inet_ntop(socket.AF_INET6, addr_bytes)
+                        addr_len = 16
                     else:
                         return
 
+                    have = self._fill(view, have, off + addr_len + 2)
+                    if have < 0:
+                        return
+
+                    addr_bytes = bytes(view[off:off + addr_len])
+                    if atyp == 1:
+                        dest_addr = socket.inet_ntoa(addr_bytes)
+                    elif atyp == 3:
+                        # Forwarded unresolved on purpose: the server resolves it, so lookups
+                        # neither leak to nor depend on the local (possibly filtered) resolver
+                        dest_addr = addr_bytes.decode()
+                    else:
+                        dest_addr = socket.inet_ntop(socket.AF_INET6, addr_bytes)
+                    off += addr_len
+
                     # Parse Port
-                    port_bytes = self.request.recv(2)
-                    dest_port = struct.unpack('>H', port_bytes)[0]
+                    dest_port = int.from_bytes(view[off:off + 2], 'big')
+                    off += 2
 
                     # Establish SSH Tunnel
                     try:
@@ -72,12 +221,26 @@ class SocksProxy:
                         )
                     except Exception as e:
                         logger.error(f"SSH Tunnel failed to {dest_addr}:{dest_port} - {e}")
-                        self.request.sendall(b"\x05\x04\x00\x01\x00\x00\x00\x00\x00\x00") # Host unreachable
+                        self.request.sendall(_SOCKS_REPLY_HOST_UNREACHABLE)
+                        return
+                    if not track(remote_channel):
+                        remote_channel.close()
                         return
 
                     # Send Success response
-                    # BND.ADDR (0.0.0.0), BND.PORT (0)
-                    self.request.sendall(b"\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00")
+                    reply = _SOCKS_REPLY_SUCCESS
+                    # A server-first protocol may already have sent its banner; ship it in the
+                    # same segment. Never wait for it: client-first protocols would deadlock.
+                    if remote_channel.recv_ready():
+                        data = remote_channel.recv(_CHUNK_SIZE)
+                        reply += data
+                        count(rx=len(data))
+                    self.request.sendall(reply)
+
+                    # Anything the client pipelined after the request is payload
+                    if have > off:
+                        remote_channel.sendall(view[off:have].tobytes())
+                        count(tx=have - off)
 
                     # Start Forwarding
                     self._forward(self.request, remote_channel)
@@ -86,24 +249,45 @@ class SocksProxy:
                     # logger.debug(f"SOCKS handler error: {e}")
                     pass
                 finally:
+                    untrack(self.request, remote_channel)
                     try: self.request.close()
                     except: pass
 
+            def _fill(self, view, have, need):
+                """Reads until at least `need` bytes are buffered; returns -1 on EOF."""
+                while have < need:
+                    n = self.request.recv_into(view[have:])
+                    if not n:
+                        return -1
+                    have += n
+                return have
+
             def _forward(self, client, remote):
+                # One selector per connection, registered once
+                sel = selectors.DefaultSelector()
+                # Client reads land in one reused buffer; paramiko channels
+                # have no recv_into, so that direction still gets fresh bytes.
+                buf = bytearray(_CHUNK_SIZE)
+                view = memoryview(buf)
                 try:
+                    sel.register(client, selectors.EVENT_READ)
+                    sel.register(remote, selectors.EVENT_READ)
                     while True:
-                        r, w, x = select.select([client, remote], [], [], 60)
-                        if client in r:
-                            data = client.recv(16384)
-                            if not data: break
-                            remote.sendall(data)
-                        if remote in r:
-                            data = remote.recv(16384)
-                            if not data: break
-                            client.sendall(data)
+                        for key, _ in sel.select(60):
+                            if key.fileobj is client:
+                                n = client.recv_into(buf)
+                                if not n: return
+                                remote.sendall(view[:n])
+                                count(tx=n)
+                            else:
+                                data = remote.recv(_CHUNK_SIZE)
+                                if not data: return
+                                client.sendall(data)
+                                count(rx=len(data))
                 except:
                     pass
                 finally:
+                    sel.close()
                     try: remote.close()
                     except: pass
 
@@ -118,4 +302,5 @@ class SocksProxy:
             self.server.shutdown()
             self.server.server_close()
             self.server = None
+        self._close_open()
         logger.info("SOCKS5 Proxy stopped")
\ No newline at end of file
@@ -3,18 +3,63 @@ PerfectSSH - Tunnel Manager
 Manages SSH tunnel connections using paramiko.
 """
 
+import random
+import socket
 import threading
 import time
 from datetime import datetime
-from typing import Tuple, Optional, Dict, Any
-import paramiko
+from typing import TYPE_CHECKING, Tuple, Optional, Dict, Any
 import logging
 from utils import SystemUtils
 from config import ConfigManager
 from proxy import SocksProxy
 
+if TYPE_CHECKING:
+    # Imported where a connection is made; paramiko pulls in the whole crypto stack
+    import paramiko
+
 logger = logging.getLogger(__name__)
 
+# Flow-control limits for tunnel channels; the paramiko defaults (2 MB window,
+# 32 KB packets) stall throughput on high bandwidth-delay links.
+_WINDOW_SIZE = 2147483647
+_MAX_PACKET_SIZE = 32768 * 4
+_KEEPALIVE_INTERVAL = 30
+
+# AEAD ciphers first: GCM authenticates as it encrypts, so no separate HMAC pass
+# per packet (paramiko implements GCM from 3.5.0). Offered algorithms not listed here
+# keep their default order after these.
+_PREFERRED_CIPHERS = ('aes128-gcm@openssh.com', 'aes256-gcm@openssh.com')
+_PREFERRED_MACS = ('hmac-sha2-256-etm@openssh.com', 'hmac-sha2-512-etm@openssh.com')
+
+# Upper bound for the retry backoff, before jitter
+_MAX_RETRY_DELAY = 30
+
+# Traffic sampling backs off from every second to this many seconds while idle
+_MAX_IDLE_INTERVAL = 5
+
+def _is_transient_error(exc: Exception) -> bool:
+    """Network-level connect failures worth retrying; auth and protocol errors are not."""
+    import paramiko
+    if isinstance(exc, (paramiko.ssh_exception.NoValidConnectionsError, socket.timeout,
+                        ConnectionResetError, ConnectionAbortedError, EOFError)):
+        return True
+    # Raised when the server accepts TCP but drops or stalls before its SSH banner
+    return isinstance(exc, paramiko.SSHException) and 'banner' in str(exc).lower()
+
+def _prefer(available: Tuple[str, ...], preferred: Tuple[str, ...]) -> Tuple[str, ...]:
+    first = tuple(name for name in preferred if name in available)
+    return first + tuple(name for name in available if name not in first)
+
+def _make_transport(sock, **kwargs) -> "paramiko.Transport":
+    """Transport factory for SSHClient.connect that negotiates the cheapest ciphers first."""
+    import paramiko
+    transport = paramiko.Transport(sock, **kwargs)
+    options = transport.get_security_options()
+    options.ciphers = _prefer(options.ciphers, _PREFERRED_CIPHERS)
+    options.digests = _prefer(options.digests, _PREFERRED_MACS)
+    return transport
+
 class TrafficMonitor:
     def __init__(self):
         self.active: bool = False
@@ -22,28 +67,37 @@ class TrafficMonitor:
         self.tx_speed: int = 0
         self.total_data: int = 0
         self._thread: Optional[threading.Thread] = None
+        self._proxy: Optional[SocksProxy] = None
+        self._stopped = threading.Event()
 
-    def start(self) -> None:
+    def start(self, proxy: SocksProxy) -> None:
+        """Samples the byte counters of the given SOCKS proxy, every second while traffic flows."""
+        self._proxy = proxy
         self.active = True
-        self._thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._monitor_loop, args=(self._stopped,), daemon=True, name="traffic-mon")
         self._thread.start()
 
     def stop(self) -> None:
         self.active = False
+        self._stopped.set()
 
-    def _monitor_loop(self) -> None:
-        import psutil
-        last_io = psutil.net_io_counters()
-        while self.active:
-            time.sleep(1)
-            try:
-                curr_io = psutil.net_io_counters()
-                self.rx_speed = curr_io.bytes_recv - last_io.bytes_recv
-                self.tx_speed = curr_io.bytes_sent - last_io.bytes_sent
-                self.total_data += (self.rx_speed + self.tx_speed)
-                last_io = curr_io
-            except:
-                pass
+    def _monitor_loop(self, stopped: threading.Event) -> None:
+        proxy = self._proxy
+        last_rx, last_tx = proxy.counters()
+        last_time = time.monotonic()
+        idle_ticks = 0
+        # Event.wait returns True as soon as stop() is called, even mid-interval
+        while not stopped.wait(min(1 + idle_ticks, _MAX_IDLE_INTERVAL)):
+            curr_rx, curr_tx = proxy.counters()
+            now = time.monotonic()
+            delta_rx, delta_tx = curr_rx - last_rx, curr_tx - last_tx
+            elapsed = now - last_time
+            self.rx_speed = int(delta_rx / elapsed)
+            self.tx_speed = int(delta_tx / elapsed)
+            self.total_data += delta_rx + delta_tx
+            last_rx, last_tx, last_time = curr_rx, curr_tx, now
+            idle_ticks = idle_ticks + 1 if not (delta_rx or delta_tx) else 0
 
     def get_formatted_stats(self) -> Tuple[str, str, str]:
         def human_fmt(num: int) -> str:
@@ -62,13 +116,18 @@ class TrafficMonitor:
 class TunnelManager:
     def __init__(self):
         self.config_manager = ConfigManager()
-        self.ssh_client: Optional[paramiko.SSHClient] = None
-        self.relay_client: Optional[paramiko.SSHClient] = None
+        self.ssh_client: Optional["paramiko.SSHClient"] = None
+        self.relay_client: Optional["paramiko.SSHClient"] = None
         self.socks_proxy: Optional[SocksProxy] = None
         self.monitor = TrafficMonitor()
         self.start_time: Optional[datetime] = None
+        self._start_monotonic: Optional[float] = None
         self.max_retries: int = 3
         self.retry_delay: int = 2
+        # Set when the active session's SSH transport goes away, so the dashboard can react
+        self.disconnected_event = threading.Event()
+        # Authenticated sessions kept across disconnects: endpoint key -> (ssh_client, relay_client)
+        self._client_cache: Dict[Tuple, Tuple["paramiko.SSHClient", Optional["paramiko.SSHClient"]]] = {}
 
     def connect(self) -> Tuple[bool, str]:
         cfg = self.config_manager.config
@@ -88,7 +147,10 @@ class TunnelManager:
                 if attempt == self.max_retries - 1:
                     logger.error(f"All connection attempts failed: {e}")
                     return False, str(e)
-                time.sleep(self.retry_delay)
+                # Exponential backoff with jitter so retries don't hammer a struggling server
+                delay = min(_MAX_RETRY_DELAY, self.retry_delay * 2 ** attempt) * (0.5 + random.random())
+                logger.debug(f"Retrying in {delay:.1f}s")
+                time.sleep(delay)
 
     def _connect_direct(self, cfg: Dict[str, Any]) -> Tuple[bool, str]:
         hop1 = cfg['hop1']
@@ -96,7 +158,14 @@ class TunnelManager:
             logger.error("Server IP is missing for direct connection")
             return False, "Server IP is missing."
         
+        # Compression is fixed when the transport is negotiated, so it is part of the key
+        key = ('1_hop', hop1['ip'], int(hop1['port']), hop1['user'], cfg.get('compression', False))
+        if self._reuse_cached(key):
+            return self._start_session(cfg, "Direct")
+        
+        import paramiko
         logger.info(f"Connecting to {hop1['ip']}:{hop1['port']} as {hop1['user']}")
+        self.relay_client = None
         self.ssh_client = paramiko.SSHClient()
         self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         
@@ -106,28 +175,27 @@ class TunnelManager:
                 port=int(hop1['port']),
                 username=hop1['user'],
                 password=hop1['pass'],
+                **self._auth_options(hop1),
+                compress=cfg.get('compression', False),
+                transport_factory=_make_transport,
                 timeout=10
             )
+            self._tune_transport(self.ssh_client.get_transport())
+            self._watch_transport(self.ssh_client.get_transport())
             
-            # Start SOCKS proxy
-            transport = self.ssh_client.get_transport()
-            self.socks_proxy = SocksProxy(cfg['local_port'], transport)
-            self.socks_proxy.start()
-            
-            self.start_time = datetime.now()
-            self.monitor.start()
-            SystemUtils.set_system_proxy(True, cfg['local_port'])
-            logger.info(f"Direct connection established successfully on port {cfg['local_port']}")
-            return True, "Connected"
+            self._client_cache[key] = (self.ssh_client, None)
+            return self._start_session(cfg, "Direct")
             
         except paramiko.AuthenticationException:
             logger.error("Authentication failed for direct connection")
+            self.ssh_client.close()
             return False, "Authentication failed"
-        except paramiko.SSHException as e:
-            logger.error(f"SSH error in direct connection: {e}")
-            return False, str(e)
         except Exception as e:
-            logger.error(f"Unexpected error in direct connection: {e}")
+            self.ssh_client.close()
+            if _is_transient_error(e):
+                raise  # connect() retries these with backoff
+            kind = "SSH error" if isinstance(e, paramiko.SSHException) else "Unexpected error"
+            logger.error(f"{kind} in direct connection: {e}")
             return False, str(e)
 
     def _connect_bridge(self, cfg: Dict[str, Any]) -> Tuple[bool, str]:
@@ -137,8 +205,15 @@ class TunnelManager:
             logger.error("Server IPs are missing for bridge connection")
             return False, "Server IPs are missing."
         
+        key = ('2_hop', hop1['ip'], int(hop1['port']), hop1['user'], hop2['ip'], int(hop2['port']), hop2['user'],
+               cfg.get('compression', False))
+        if self._reuse_cached(key):
+            return self._start_session(cfg, "Bridge")
+        
+        import paramiko
         logger.info(f"Connecting to relay {hop1['ip']}:{hop1['port']} as {hop1['user']}")
         # Connect to relay first
+        self.ssh_client = None
         self.relay_client = paramiko.SSHClient()
         self.relay_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         
@@ -148,8 +223,11 @@ class TunnelManager:
                 port=int(hop1['port']),
                 username=hop1['user'],
                 password=hop1['pass'],
+                **self._auth_options(hop1),
+                transport_factory=_make_transport,
                 timeout=10
             )
+            self._tune_transport(self.relay_client.get_transport())
             
             logger.info(f"Relay connected, now connecting to destination {hop2['ip']}:{hop2['port']} as {hop2['user']}")
             # Use relay as proxy for destination
@@ -164,49 +242,110 @@ class TunnelManager:
                 port=int(hop2['port']),
                 username=hop2['user'],
                 password=hop2['pass'],
+                **self._auth_options(hop2),
                 sock=sock,
+                compress=cfg.get('compression', False),
+                transport_factory=_make_transport,
                 timeout=10
             )
+            self._tune_transport(self.ssh_client.get_transport())
+            self._watch_transport(self.ssh_client.get_transport())
             
-            # Start SOCKS proxy
-            transport = self.ssh_client.get_transport()
-            self.socks_proxy = SocksProxy(cfg['local_port'], transport)
-            self.socks_proxy.start()
-            
-            self.start_time = datetime.now()
-            self.monitor.start()
-            SystemUtils.set_system_proxy(True, cfg['local_port'])
-            logger.info(f"Bridge connection established successfully on port {cfg['local_port']}")
-            return True, "Connected"
+            self._client_cache[key] = (self.ssh_client, self.relay_client)
+            return self._start_session(cfg, "Bridge")
             
         except paramiko.AuthenticationException:
             logger.error("Authentication failed for bridge connection")
-            if self.relay_client:
-                self.relay_client.close()
+            self._close_clients(self.ssh_client, self.relay_client)
             return False, "Authentication failed"
-        except paramiko.SSHException as e:
-            logger.error(f"SSH error in bridge connection: {e}")
-            if self.relay_client:
-                self.relay_client.close()
-            return False, str(e)
         except Exception as e:
-            logger.error(f"Unexpected error in bridge connection: {e}")
-            if self.relay_client:
-                self.relay_client.close()
+            self._close_clients(self.ssh_client, self.relay_client)
+            if _is_transient_error(e):
+                raise  # connect() retries these with backoff
+            kind = "SSH error" if isinstance(e, paramiko.SSHException) else "Unexpected error"
+            logger.error(f"{kind} in bridge connection: {e}")
             return False, str(e)
 
-    def disconnect(self) -> None:
+    def _start_session(self, cfg: Dict[str, Any], label: str) -> Tuple[bool, str]:
+        """Starts the SOCKS proxy and monitoring on top of the connected SSH client."""
+        self.disconnected_event.clear()
+        transport = self.ssh_client.get_transport()
+        self.socks_proxy = SocksProxy(cfg['local_port'], transport)
+        self.socks_proxy.start()
+        
+        self.start_time = datetime.now()
+        self._start_monotonic = time.monotonic()
+        self.monitor.start(self.socks_proxy)
+        SystemUtils.set_system_proxy(True, cfg['local_port'])
+        SystemUtils.clear_ip_cache()
+        logger.info(f"{label} connection established successfully on port {cfg['local_port']}")
+        return True, "Connected"
+
+    @staticmethod
+    def _auth_options(hop: Dict[str, Any]) -> Dict[str, bool]:
+        """With a password configured, skip the agent and key-file attempts that precede it."""
+        use_keys = not hop['pass']
+        return {'allow_agent': use_keys, 'look_for_keys': use_keys}
+
+    @staticmethod
+    def _tune_transport(transport: "paramiko.Transport") -> None:
+        """Raises channel window/packet limits and enables keepalives on a fresh transport."""
+        transport.default_window_size = _WINDOW_SIZE
+        transport.default_max_packet_size = _MAX_PACKET_SIZE
+        transport.set_keepalive(_KEEPALIVE_INTERVAL)
+
+    def _watch_transport(self, transport: "paramiko.Transport") -> None:
+        """Sets disconnected_event when this transport's thread exits while it is still the active one."""
+        def watch():
+            # The transport thread ends on close, EOF or a failed keepalive; in bridge mode
+            # losing the relay also ends it, since its socket is a channel on the relay
+            transport.join()
+            client = self.ssh_client
+            if client is not None and client.get_transport() is transport:
+                self.disconnected_event.set()
+        threading.Thread(target=watch, daemon=True, name="ssh-watch").start()
+
+    def _reuse_cached(self, key: Tuple) -> bool:
+        """Reattaches to a cached session for this endpoint if it is still authenticated."""
+        for stale in [k for k in self._client_cache if k != key]:
+            self._close_clients(*self._client_cache.pop(stale))
+        
+        cached = self._client_cache.get(key)
+        if not cached:
+            return False
+        
+        transport = cached[0].get_transport()
+        if transport is not None and transport.is_active() and transport.is_authenticated():
+            logger.info("Reusing cached SSH session")
+            self.ssh_client, self.relay_client = cached
+            return True
+        
+        del self._client_cache[key]
+        self._close_clients(*cached)
+        return False
+
+    def _close_clients(self, ssh_client: Optional["paramiko.SSHClient"], relay_client: Optional["paramiko.SSHClient"]) -> None:
+        if ssh_client:
+            ssh_client.close()
+            logger.debug("SSH client closed")
+        if relay_client:
+            relay_client.close()
+            logger.debug("Relay client closed")
+
+    def disconnect(self, keep_transport: bool = False) -> None:
+        """Tears down the tunnel; with keep_transport the SSH session stays cached for reconnects."""
         logger.info("Disconnecting tunnel")
         if self.socks_proxy:
             self.socks_proxy.stop()
             self.socks_proxy = None
             logger.debug("SOCKS proxy stopped")
-        if self.ssh_client:
-            self.ssh_client.close()
-            logger.debug("SSH client closed")
-        if self.relay_client:
-            self.relay_client.close()
-            logger.debug("Relay client closed")
+        if not keep_transport:
+            for clients in self._client_cache.values():
+                self._close_clients(*clients)
+            self._client_cache.clear()
+            self._close_clients(self.ssh_client, self.relay_client)
+        self.ssh_client = None
+        self.relay_client = None
         self.monitor.stop()
         SystemUtils.set_system_proxy(False)
         SystemUtils.kill_existing_ssh()
@@ -1,21 +1,19 @@
-from rich.live import Live
-from rich.layout import Layout
-from rich.align import Align
-from rich.table import Table
-from rich.prompt import Prompt, IntPrompt, Confirm
-from rich import box
-import inquirer
+import signal
 import time
 import logging
-from datetime import datetime
 from rich.console import Console
 from rich.panel import Panel
+from utils import SystemUtils
+
+# inquirer and the dashboard/prompt parts of rich are imported by the functions
+# that use them, keeping them off the startup path
 
 console = Console()
 logger = logging.getLogger(__name__)
 
 def get_user_selection(title, choices):
     """Safe wrapper for inquirer to prevent crashes on cancellation."""
+    import inquirer
     try:
         q = [inquirer.List('opt', message=title, choices=choices)]
         answer = inquirer.prompt(q)
@@ -24,51 +22,82 @@ def get_user_selection(title, choices):
     except KeyboardInterrupt:
         return None
 
+class _Cell:
+    """Mutable dashboard cell; rich renders its current markup on every refresh."""
+    __slots__ = ('value',)
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def __rich__(self):
+        return self.value
+
 def show_dashboard(manager):
     """Displays the connection dashboard with real-time updates."""
     if manager.ssh_client and manager.ssh_client.get_transport().is_active():
+        from rich.live import Live
+        from rich.layout import Layout
+        from rich.align import Align
+        from rich.table import Table
+        from rich import box
         logger.info("Displaying connection dashboard")
         
+        # The layout is built once; each refresh only rewrites the cell values.
+        uptime, rx, tx, total = _Cell(), _Cell(), _Cell(), _Cell()
+        
+        grid = Table.grid(expand=True)
+        grid.add_column()
+        grid.add_column(justify="right")
+        grid.add_row("[bold green]● CONNECTED[/bold green]", uptime)
+        grid.add_row(f"Mode: {manager.config_manager.config['mode']}", f"Port: {manager.config_manager.config['local_port']}")
+        
+        traffic_table = Table(show_header=False, expand=True, box=box.SIMPLE)
+        traffic_table.add_row("Download", rx)
+        traffic_table.add_row("Upload", tx)
+        traffic_table.add_row("Session Total", total)
+        
+        layout = Layout()
+        layout.split_column(
+            Layout(Panel(grid, style="green")),
+            Layout(Panel(traffic_table, title="Live Traffic", border_style="magenta")),
+            Layout(Panel(Align.center("Press [bold red]Ctrl+C[/bold red] to Disconnect"), style="dim"))
+        )
+        
         def generate_dashboard():
-            rx, tx, total = manager.monitor.get_formatted_stats()
-            # Handle case where start_time might be None (though it shouldn't be if connected)
-            if manager.start_time:
-                uptime = str(datetime.now() - manager.start_time).split('.')[0]
-            else:
-                uptime = "0:00:00"
-            
-            grid = Table.grid(expand=True)
-            grid.add_column()
-            grid.add_column(justify="right")
-            grid.add_row("[bold green]● CONNECTED[/bold green]", f"Uptime: {uptime}")
-            grid.add_row(f"Mode: {manager.config_manager.config['mode']}", f"Port: {manager.config_manager.config['local_port']}")
-            
-            traffic_table = Table(show_header=False, expand=True, box=box.SIMPLE)
-            traffic_table.add_row("Download", rx)
-            traffic_table.add_row("Upload", tx)
-            traffic_table.add_row("Session Total", total)
-            
-            layout = Layout()
-            layout.split_column(
-                Layout(Panel(grid, style="green")),
-                Layout(Panel(traffic_table, title="Live Traffic", border_style="magenta")),
-                Layout(Panel(Align.center("Press [bold red]Ctrl+C[/bold red] to Disconnect"), style="dim"))
-            )
+            rx.value, tx.value, total.value = manager.monitor.get_formatted_stats()
+            # Handle case where the start time might be missing (though it shouldn't be if connected)
+            secs = int(time.monotonic() - manager._start_monotonic) if manager._start_monotonic else 0
+            uptime.value = f"Uptime: {secs // 3600}:{secs // 60 % 60:02d}:{secs % 60:02d}"
             return layout
 
+        # Live's own refresh thread redraws via get_renderable; this thread just blocks
+        # until Ctrl+C or the SSH link drops. Windows only delivers Ctrl+C between
+        # waits, so wait in slices there.
+        lost = manager.disconnected_event
+        wait_slice = 1 if SystemUtils.IS_WIN else None
+        # main.py's SIGINT handler exits the app; here Ctrl+C only leaves the dashboard
+        previous_handler = signal.signal(signal.SIGINT, signal.default_int_handler)
         try:
-            with Live(generate_dashboard(), refresh_per_second=1) as live:
-                while True:
-                    time.sleep(1)
-                    live.update(generate_dashboard())
+            with Live(get_renderable=generate_dashboard, refresh_per_second=1, console=console):
+                while not lost.wait(wait_slice):
+                    pass
         except KeyboardInterrupt:
             logger.info("User requested disconnection via Ctrl+C")
-            manager.disconnect()
+            manager.disconnect(keep_transport=True)
             return True  # Disconnected
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        
+        logger.warning("SSH connection lost, tearing down tunnel")
+        manager.disconnect()
+        console.print("[bold red]✗ Connection to the server was lost.[/bold red]")
+        console.input("Press Enter...")
+        return True  # Disconnected
     return False
 
 def show_settings(manager):
     """Handles the settings menu."""
+    from rich.prompt import Prompt, Confirm
     logger.info("Entering settings menu")
     while True:
         console.print(Panel("[bold yellow]Configuration Settings[/bold yellow]", border_style="yellow"))
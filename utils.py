@@ -5,97 +5,231 @@ Cross-platform utilities for system operations.
 
 import os
 import sys
-import shutil
+import atexit
+import re
+import shlex
+import socket
 import subprocess
-import platform
-import requests
+import functools
+import time
 import logging
 from rich.console import Console
 
+try:
+    import orjson
+except ImportError:  # Optional speedup; response.json() is the fallback
+    orjson = None
+
 console = Console()
 logger = logging.getLogger(__name__)
 
+# Resolved once at import; sys.platform is a constant, unlike platform.system()
+_IS_WIN = sys.platform == "win32"
+_IS_MAC = sys.platform == "darwin"
+
+# subprocess only takes its posix_spawn fast path (no page-table copy of this
+# process) for an absolute executable with close_fds=False. Python's own fds are
+# non-inheritable (PEP 446), so nothing leaks into the child.
+_SPAWN_OPTIONS = {'close_fds': False}
+
+# macOS: "interface: en0" from `route get`, and the Hardware Port/Device pairs
+# from `networksetup -listallhardwareports`
+_INTERFACE_RE = re.compile(r'interface:\s*(\S+)')
+_PORT_RE = re.compile(r'^Hardware Port:\s*(.+?)\s*\nDevice:\s*(\S+)', re.MULTILINE)
+
+# One requests.Session per proxy port (None = direct) so repeat IP checks reuse
+# the pooled connection instead of a fresh TCP and SOCKS handshake each time
+_session_cache = {}
+
+# Plain-text key=value trace (ip=, loc=); a fraction of the bytes of a JSON geo lookup
+_IP_TRACE_URL = 'https://www.cloudflare.com/cdn-cgi/trace'
+
+# Geo lookup for when the city is wanted: only the fields the status line shows (plus
+# status), not the full ~15-field record. ip-api's free tier is HTTP-only.
+_IP_API_HOST = 'ip-api.com'
+_IP_API_PATH = '/json?fields=status,query,countryCode,city'
+
+# Flat "key":"value" string pairs of that small response, in whatever order ip-api
+# sends them; values with escapes don't match and send the parse to the JSON fallback
+_JSON_FIELD_RE = re.compile(rb'"(\w+)":"([^"\\]*)"')
+_GEO_FIELDS = frozenset({'query', 'countryCode', 'city'})
+
+# (connect, read): a dead proxy fails fast instead of eating the whole budget
+_IP_TIMEOUT = (2, 6)
+
+# Last successful lookup per (proxy port, geo): (formatted result, monotonic expiry)
+_IP_CACHE_TTL = 30.0
+_ip_cache = {}
+
+# Windows: the Internet Settings key is opened once and reused across proxy toggles
+_IE_SETTINGS_PATH = r'Software\Microsoft\Windows\CurrentVersion\Internet Settings'
+_INTERNET_OPTION_REFRESH = 37
+_INTERNET_OPTION_SETTINGS_CHANGED = 39
+_ie_settings_key = None
+
+def _get_ie_settings_key():
+    global _ie_settings_key
+    if _ie_settings_key is None:
+        import winreg
+        _ie_settings_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, _IE_SETTINGS_PATH, 0, winreg.KEY_ALL_ACCESS)
+        atexit.register(winreg.CloseKey, _ie_settings_key)
+    return _ie_settings_key
+
+def _fetch_ip_trace(session):
+    response = session.get(_IP_TRACE_URL, timeout=_IP_TIMEOUT)
+    if response.status_code != 200:
+        return None
+    fields = dict(line.partition('=')[::2] for line in response.text.splitlines())
+    if not fields.get('ip'):
+        return None
+    logger.info("Public IP fetched: %s (%s)", fields['ip'], fields.get('loc', '??'))
+    return f"[bold green]{fields['ip']}[/bold green] ({fields.get('loc', '??')})"
+
+# Direct lookups only: (resolved address, monotonic expiry), so a changed
+# record is picked up again after _IP_API_ADDR_TTL
+_IP_API_ADDR_TTL = 300.0
+_ip_api_addr = None
+
+def _ip_api_address():
+    """Resolves ip-api.com on first use and re-resolves once the pin expires."""
+    global _ip_api_addr
+    now = time.monotonic()
+    if _ip_api_addr is None or _ip_api_addr[1] <= now:
+        try:
+            _ip_api_addr = (socket.gethostbyname(_IP_API_HOST), now + _IP_API_ADDR_TTL)
+        except OSError:
+            return _IP_API_HOST  # Let requests resolve it; try again next time
+    return _ip_api_addr[0]
+
+def _fetch_ip_geo(session):
+    # Through the tunnel the name goes to the server (socks5h), so the local
+    # resolver is never consulted; a direct check pins the address and sends a
+    # Host header, which plain HTTP allows, to skip the per-connection lookup
+    host = _IP_API_HOST if session.proxies else _ip_api_address()
+    response = session.get(f"http://{host}{_IP_API_PATH}",
+                           headers={'Host': _IP_API_HOST}, timeout=_IP_TIMEOUT)
+    if response.status_code != 200:
+        return None
+    data = {key.decode(): value.decode() for key, value in _JSON_FIELD_RE.findall(response.content)}
+    if not _GEO_FIELDS <= data.keys():
+        data = orjson.loads(response.content) if orjson is not None else response.json()
+    logger.info("Public IP fetched: %s (%s)", data['query'], data['countryCode'])
+    return f"[bold green]{data['query']}[/bold green] ({data['countryCode']}, {data['city']})"
+
+def _get_session(proxy_port):
+    session = _session_cache.get(proxy_port)
+    if session is None:
+        # requests (urllib3, idna, charset detection) is only loaded once an IP check runs
+        import requests
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        if proxy_port:
+            # socks5h: hostnames are resolved by the server, not the local resolver
+            session.proxies = {
+                'http': f'socks5h://127.0.0.1:{proxy_port}',
+                'https': f'socks5h://127.0.0.1:{proxy_port}'
+            }
+        # Ride out a transient proxy or gateway hiccup before reporting failure;
+        # a read timeout is not retried, so a stalled check gives up after one _IP_TIMEOUT
+        retry = Retry(total=2, read=0, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=10)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        _session_cache[proxy_port] = session
+    return session
+
 class SystemUtils:
-    IS_WIN = platform.system() == "Windows"
-    IS_MAC = platform.system() == "Darwin"
+    IS_WIN = _IS_WIN
+    IS_MAC = _IS_MAC
 
     @staticmethod
     def clear_screen():
-        os.system('cls' if SystemUtils.IS_WIN else 'clear')
+        # VT escape codes via rich; only a legacy (pre-VT) Windows console needs to spawn cls
+        if _IS_WIN and console.legacy_windows:
+            os.system('cls')
+        else:
+            console.clear()
 
     @staticmethod
     def verify_sshpass():
-        """Ensures sshpass is installed on non-Windows systems."""
-        # sshpass is no longer required as we use paramiko exclusively
+        """Kept for callers; a no-op since connections no longer shell out to sshpass."""
+        # sshpass is no longer required as we use paramiko exclusively, so there is
+        # no PATH lookup to cache here
         logger.debug("sshpass check skipped (not required)")
         return
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def _get_macos_active_service():
-        """Detects the currently active network service on macOS."""
+        """Detects the currently active network service on macOS (cached for the session)."""
         try:
-            # 1. Get default route interface (e.g., en0)
-            result = subprocess.run(["route", "-n", "get", "default"], capture_output=True, text=True)
-            interface_line = [line for line in result.stdout.split('\n') if "interface:" in line]
-            if not interface_line:
+            # One shell for both steps: the default route interface (e.g., en0)
+            # and the hardware port list that maps it to a Service Name (Wi-Fi)
+            result = subprocess.run(["/bin/sh", "-c", "route -n get default; networksetup -listallhardwareports"],
+                                    capture_output=True, text=True, **_SPAWN_OPTIONS)
+            match = _INTERFACE_RE.search(result.stdout)
+            if not match:
                 return None
-            interface = interface_line[0].split(':')[1].strip()
-
-            # 2. Map interface (en0) to Service Name (Wi-Fi)
-            result = subprocess.run(["networksetup", "-listallhardwareports"], capture_output=True, text=True)
-            lines = result.stdout.split('\n')
-            current_service = None
-            
-            for i, line in enumerate(lines):
-                if "Hardware Port:" in line:
-                    current_service = line.split(':')[1].strip()
-                if f"Device: {interface}" in line and current_service:
-                    return current_service
-                    
+            ports = {device: service for service, device in _PORT_RE.findall(result.stdout)}
+            return ports.get(match.group(1))
         except Exception as e:
-            logger.debug(f"Error detecting active service: {e}")
+            logger.debug("Error detecting active service: %s", e)
         return None
 
     @staticmethod
     def set_system_proxy(enable=True, port=1080):
         """Configures the system-wide SOCKS5 proxy."""
-        logger.info(f"Setting system proxy {'on' if enable else 'off'} on port {port}")
-        if SystemUtils.IS_MAC:
+        logger.info("Setting system proxy %s on port %s", 'on' if enable else 'off', port)
+        if _IS_MAC:
             state = "on" if enable else "off"
             
             # Try to detect active service first
             active_service = SystemUtils._get_macos_active_service()
+            if not active_service:
+                # Don't let a failed detection stick for the rest of the session
+                SystemUtils._get_macos_active_service.cache_clear()
             services = [active_service] if active_service else ["Wi-Fi", "Ethernet", "Thunderbolt Bridge"]
             
-            logger.info(f"Applying proxy settings to: {services}")
+            logger.info("Applying proxy settings to: %s", services)
             
+            # Only the SOCKS proxy is set: the local port speaks SOCKS5, so pointing
+            # the web/secure-web proxies at it would break plain HTTP clients.
+            # SOCKS Proxy for every service in a single shell. Each service is its own
+            # background job, so the fallback services configure in parallel and one
+            # failing service doesn't stop the others.
+            # Turning the proxy off only needs the state flip, not the address.
+            jobs = []
             for service in services:
-                if not service: continue
-                try:
-                    # SOCKS Proxy
-                    subprocess.run(["networksetup", "-setsocksfirewallproxy", service, "127.0.0.1", str(port)], stderr=subprocess.DEVNULL)
-                    subprocess.run(["networksetup", "-setsocksfirewallproxystate", service, state], stderr=subprocess.DEVNULL)
-                except Exception as e:
-                    logger.debug(f"Failed to set proxy for {service}: {e}")
-                    continue
+                quoted = shlex.quote(service)
+                toggle = f"networksetup -setsocksfirewallproxystate {quoted} {state}"
+                if enable:
+                    toggle = f"networksetup -setsocksfirewallproxy {quoted} 127.0.0.1 {int(port)}; {toggle}"
+                jobs.append(f"( {toggle} ) &")
+            jobs.append("wait")
+            try:
+                subprocess.run(["/bin/sh", "-c", "\n".join(jobs)], stderr=subprocess.DEVNULL, **_SPAWN_OPTIONS)
+            except Exception as e:
+                logger.debug("Failed to set proxy for %s: %s", services, e)
             logger.info("System proxy configured for macOS")
 
-        elif SystemUtils.IS_WIN:
+        elif _IS_WIN:
             import winreg
+            import ctypes
             try:
-                key_path = r'Software\Microsoft\Windows\CurrentVersion\Internet Settings'
-                key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_ALL_ACCESS)
+                key = _get_ie_settings_key()
                 if enable:
                     winreg.SetValueEx(key, 'ProxyEnable', 0, winreg.REG_DWORD, 1)
                     winreg.SetValueEx(key, 'ProxyServer', 0, winreg.REG_SZ, f"socks=127.0.0.1:{port}")
                 else:
                     winreg.SetValueEx(key, 'ProxyEnable', 0, winreg.REG_DWORD, 0)
-                winreg.CloseKey(key)
-                # Refresh system settings
-                os.system('inetcpl.cpl ,4')
+                # Refresh system settings in-process rather than spawning the control panel
+                wininet = ctypes.windll.wininet
+                wininet.InternetSetOptionW(None, _INTERNET_OPTION_SETTINGS_CHANGED, None, 0)
+                wininet.InternetSetOptionW(None, _INTERNET_OPTION_REFRESH, None, 0)
                 logger.info("System proxy configured for Windows")
             except Exception as e:
-                logger.warning(f"Failed to configure Windows proxy: {e}")
+                logger.warning("Failed to configure Windows proxy: %s", e)
 
         else:
             logger.info("System proxy configuration not supported on this platform")
@@ -103,31 +237,59 @@ class SystemUtils:
     @staticmethod
     def kill_existing_ssh():
         """Kills any lingering SSH SOCKS tunnels."""
+        try:
+            import psutil
+        except ImportError:
+            # Only stale-tunnel cleanup needs it; never let it break connect or exit
+            logger.warning("psutil is not installed; skipping cleanup of old SSH tunnels")
+            return
         logger.debug("Killing existing SSH processes")
-        if SystemUtils.IS_WIN:
-            os.system("taskkill /F /IM ssh.exe >nul 2>&1")
-        else:
-            subprocess.run(["pkill", "-f", "ssh.*-D"], stderr=subprocess.DEVNULL)
+        # Only ssh clients running a SOCKS listener (-D), found in-process instead of
+        # forking pkill/taskkill to regex-scan every command line
+        ssh_name = "ssh.exe" if _IS_WIN else "ssh"
+        tunnels = []
+        for proc in psutil.process_iter(['name', 'cmdline']):
+            cmdline = proc.info['cmdline']
+            if proc.info['name'] == ssh_name and cmdline and any(arg.startswith('-D') for arg in cmdline[1:]):
+                try:
+                    proc.terminate()
+                    tunnels.append(proc)
+                except psutil.Error:
+                    continue
+        _, alive = psutil.wait_procs(tunnels, timeout=2)
+        for proc in alive:
+            try:
+                proc.kill()
+            except psutil.Error:
+                continue
         logger.info("Existing SSH processes killed")
 
     @staticmethod
-    def fetch_public_ip(proxy_port=None):
-        """Fetches the current public IP address."""
-        logger.debug(f"Fetching public IP{' via proxy port ' + str(proxy_port) if proxy_port else ''}")
+    def clear_ip_cache():
+        """Forgets cached public IPs; the egress address changes whenever the tunnel does."""
+        _ip_cache.clear()
+
+    @staticmethod
+    def fetch_public_ip(proxy_port=None, force=False, geo=False):
+        """Fetches the current public IP address and country (plus city with geo=True).
+
+        Results are reused for 30s unless forced.
+        """
+        now = time.monotonic()
+        key = (proxy_port, geo)
+        entry = _ip_cache.get(key)
+        if entry and entry[1] > now and not force:
+            return entry[0]
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Fetching public IP%s", f" via proxy port {proxy_port}" if proxy_port else "")
         try:
-            proxies = None
-            if proxy_port:
-                proxies = {
-                    'http': f'socks5://127.0.0.1:{proxy_port}',
-                    'https': f'socks5://127.0.0.1:{proxy_port}'
-                }
-            
-            response = requests.get('http://ip-api.com/json', proxies=proxies, timeout=8)
-            if response.status_code == 200:
-                data = response.json()
-                logger.info(f"Public IP fetched: {data['query']} ({data['countryCode']})")
-                return f"[bold green]{data['query']}[/bold green] ({data['countryCode']}, {data['city']})"
+            session = _get_session(proxy_port)
+            result = _fetch_ip_geo(session) if geo else _fetch_ip_trace(session)
+            if result:
+                _ip_cache[key] = (result, now + _IP_CACHE_TTL)
+                return result
         except Exception as e:
-            logger.warning(f"Failed to fetch public IP: {e}")
+            logger.warning("Failed to fetch public IP: %s", e)
             return "[red]Connection Failed[/red]"
         return "[yellow]Unknown[/yellow]"
\ No newline at end of file